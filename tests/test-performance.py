@@ -1,18 +1,25 @@
 #!/usr/bin/env python3
 """
 Email Performance Test Script
-Tests emails individually, tracks comprehensive metrics, and generates detailed reports.
+Submits emails in batches, tracks comprehensive metrics per email, and generates detailed reports.
 Similar to emailtester.ninja functionality.
 """
 
+import asyncio
 import csv
 import json
+import queue
+import random
 import time
 import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Optional, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
+import httpx
+import numpy as np
 import requests
-from collections import defaultdict
+from requests.adapters import HTTPAdapter
 
 # Try to import tqdm for progress bar, fallback gracefully
 try:
@@ -22,41 +29,89 @@ except ImportError:
     HAS_TQDM = False
     print("Note: tqdm not available. Install with 'pip install tqdm' for progress bar.")
 
+# Try to import orjson for faster JSON output, fallback to the stdlib encoder
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
 # Configuration
 API_BASE_URL = "http://localhost:8080"
 API_VERIFY_ENDPOINT = f"{API_BASE_URL}/api/verify"
 API_JOB_ENDPOINT = f"{API_BASE_URL}/api/job"
-POLL_INTERVAL = 0.5  # 500ms
+POLL_INTERVAL = 0.5  # 500ms between poller sweeps over all in-flight jobs
 MAX_WAIT_TIME = 60  # seconds per email
-INITIAL_POLL_INTERVAL = 0.5
-EXPONENTIAL_BACKOFF_START = 5  # seconds before exponential backoff
 MAX_RETRIES = 3
-RETRY_DELAY = 1  # seconds
+RETRY_DELAY = 1  # seconds, base of the exponential retry backoff
+RETRYABLE_STATUS_CODES = (429, 502, 503, 504)  # job status responses the next sweep polls again
+# POST /api/verify creates a job, so only retry responses that mean it was not accepted
+RETRYABLE_SUBMIT_STATUS_CODES = (429, 503)
+CONCURRENCY = 32  # batch POSTs sent in parallel
+BATCH_SIZE = 50  # emails submitted per /api/verify request
+# Emails submitted but not yet finished. The worker checks 2 emails/second
+# (worker/ratelimiter.go) and each email's MAX_WAIT_TIME starts at submission,
+# so the queue in front of the last one must clear well within it.
+MAX_IN_FLIGHT = 100
+HTTP_POOL_SIZE = 64  # keep-alive connections held by the shared session
+POLL_MAX_CONNECTIONS = 200  # connections the poller's async client keeps open
+
+# Shared session so every request reuses pooled keep-alive connections
+SESSION = requests.Session()
+SESSION.mount('http://', HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, pool_block=False))
+SESSION.mount('https://', HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE, pool_block=False))
+
+# CSV output columns, in TestResult.to_csv_tuple order
+CSV_FIELDNAMES = (
+    'email', 'category', 'expected_result', 'actual_status', 'smtp_code',
+    'bounce_reason', 'match_expected', 'api_request_time', 'queue_time',
+    'processing_time', 'total_time', 'poll_count', 'poll_interval_avg',
+    'timestamp_submitted', 'timestamp_completed', 'job_id', 'error', 'timeout'
+)
 
 # Status mapping for expected vs actual comparison
 EXPECTED_TO_ACTUAL = {
-    'valid': ['VALID', 'CATCH_ALL'],
-    'invalid': ['INVALID'],
-    'disposable': ['VALID', 'CATCH_ALL', 'INVALID']  # Disposable can be any
+    'valid': frozenset(('VALID', 'CATCH_ALL')),
+    'invalid': frozenset(('INVALID',)),
+    'disposable': frozenset(('VALID', 'CATCH_ALL', 'INVALID'))  # Disposable can be any
 }
 
 
 class TestResult:
     """Stores test result for a single email"""
+    # Fixed attribute layout: no per-instance __dict__ for the N results of a run
+    __slots__ = (
+        'email', 'expected_result', 'category', 'expected_lower',
+        'timestamp_submitted', 'timestamp_completed', 'perf_submitted', 'perf_completed',
+        '_timestamp_submitted_iso', '_timestamp_completed_iso',
+        'api_request_time', 'queue_time', 'processing_time', 'total_time',
+        'poll_count', 'poll_interval_sum', 'poll_interval_count', 'early_poll_interval_sum',
+        'job_id', 'actual_status', 'smtp_code', 'bounce_reason', 'match_expected',
+        'error', 'timeout', 'poll_started', 'last_poll_time', 'last_poll_error'
+    )
+    
     def __init__(self, email: str, expected_result: str, category: str):
         self.email = email
         self.expected_result = expected_result
         self.category = category
+        self.expected_lower = expected_result.lower()  # normalized once for compare_results
         
         # Timing metrics
-        self.timestamp_submitted: Optional[float] = None
-        self.timestamp_completed: Optional[float] = None
+        self.timestamp_submitted: Optional[float] = None  # wall clock, for reporting
+        self.timestamp_completed: Optional[float] = None  # wall clock, for reporting
+        self.perf_submitted: Optional[float] = None  # perf_counter, for elapsed times
+        self.perf_completed: Optional[float] = None  # perf_counter, for elapsed times
+        self._timestamp_submitted_iso: Optional[str] = None  # cached by timestamp_submitted_iso
+        self._timestamp_completed_iso: Optional[str] = None  # cached by timestamp_completed_iso
         self.api_request_time: Optional[float] = None  # ms
         self.queue_time: Optional[float] = None  # ms
         self.processing_time: Optional[float] = None  # ms
         self.total_time: Optional[float] = None  # ms
         self.poll_count = 0
-        self.poll_intervals: List[float] = []
+        # Running poll interval stats (ms) instead of keeping every interval
+        self.poll_interval_sum = 0.0
+        self.poll_interval_count = 0
+        self.early_poll_interval_sum = 0.0  # first 3 intervals, used for queue_time
         
         # Result metrics
         self.job_id: Optional[str] = None
@@ -68,6 +123,32 @@ class TestResult:
         # Error tracking
         self.error: Optional[str] = None
         self.timeout = False
+        
+        # Polling state, driven by the shared Poller
+        self.poll_started: Optional[float] = None  # perf_counter
+        self.last_poll_time: Optional[float] = None  # perf_counter
+        self.last_poll_error: Optional[str] = None  # why the latest poll failed, if it did
+
+    @property
+    def poll_interval_avg(self) -> Optional[float]:
+        """Average interval between polls in ms, None until polled twice"""
+        if not self.poll_interval_count:
+            return None
+        return self.poll_interval_sum / self.poll_interval_count
+
+    @property
+    def timestamp_submitted_iso(self) -> Optional[str]:
+        """ISO-format timestamp_submitted, formatted once and shared by the CSV and JSON rows"""
+        if self._timestamp_submitted_iso is None and self.timestamp_submitted:
+            self._timestamp_submitted_iso = datetime.fromtimestamp(self.timestamp_submitted).isoformat()
+        return self._timestamp_submitted_iso
+
+    @property
+    def timestamp_completed_iso(self) -> Optional[str]:
+        """ISO-format timestamp_completed, formatted once and shared by the CSV and JSON rows"""
+        if self._timestamp_completed_iso is None and self.timestamp_completed:
+            self._timestamp_completed_iso = datetime.fromtimestamp(self.timestamp_completed).isoformat()
+        return self._timestamp_completed_iso
 
     def to_dict(self) -> Dict:
         """Convert to dictionary for JSON/CSV output"""
@@ -84,20 +165,88 @@ class TestResult:
             'processing_time': round(self.processing_time, 2) if self.processing_time else None,
             'total_time': round(self.total_time, 2) if self.total_time else None,
             'poll_count': self.poll_count,
-            'poll_interval_avg': round(sum(self.poll_intervals) / len(self.poll_intervals), 2) if self.poll_intervals else None,
-            'timestamp_submitted': datetime.fromtimestamp(self.timestamp_submitted).isoformat() if self.timestamp_submitted else None,
-            'timestamp_completed': datetime.fromtimestamp(self.timestamp_completed).isoformat() if self.timestamp_completed else None,
+            'poll_interval_avg': round(self.poll_interval_avg, 2) if self.poll_interval_count else None,
+            'timestamp_submitted': self.timestamp_submitted_iso,
+            'timestamp_completed': self.timestamp_completed_iso,
             'job_id': self.job_id,
             'error': self.error,
             'timeout': self.timeout
         }
 
-    def to_csv_row(self) -> Dict:
-        """Convert to CSV row format"""
-        d = self.to_dict()
-        # Flatten poll_interval_avg
-        d['poll_interval_avg'] = d.pop('poll_interval_avg')
-        return d
+    def to_csv_tuple(self) -> Tuple:
+        """Convert to a CSV row in CSV_FIELDNAMES order, without building an intermediate dict"""
+        return (
+            self.email,
+            self.category,
+            self.expected_result,
+            self.actual_status,
+            self.smtp_code,
+            self.bounce_reason,
+            self.match_expected,
+            round(self.api_request_time, 2) if self.api_request_time else None,
+            round(self.queue_time, 2) if self.queue_time else None,
+            round(self.processing_time, 2) if self.processing_time else None,
+            round(self.total_time, 2) if self.total_time else None,
+            self.poll_count,
+            round(self.poll_interval_avg, 2) if self.poll_interval_count else None,
+            self.timestamp_submitted_iso,
+            self.timestamp_completed_iso,
+            self.job_id,
+            self.error,
+            self.timeout
+        )
+
+
+class Results:
+    """
+    Column-oriented (struct-of-arrays) store of finished test results used for summaries.
+    Rows are appended in completion order, as run_tests yields them; numeric columns use NaN
+    for missing values. Finished TestResults need not be kept once they are appended.
+    Category and status strings are encoded to integer codes as each row is appended,
+    so every TestResult is walked exactly once and summaries only reduce numeric columns.
+    """
+    def __init__(self, capacity: int):
+        self.size = 0
+        
+        # String -> code lookups, in first-seen order
+        self.categories: Dict[str, int] = {}
+        self.statuses: Dict[str, int] = {}
+        
+        # String columns kept for the error report (None when missing)
+        self.email = np.full(capacity, None, dtype=object)
+        self.error = np.full(capacity, None, dtype=object)
+        
+        # Numeric columns
+        self.category_code = np.zeros(capacity, dtype=np.int32)
+        self.status_code = np.full(capacity, -1, dtype=np.int32)  # -1 = not completed
+        self.errored = np.zeros(capacity, dtype=bool)
+        self.api_request_time = np.full(capacity, np.nan)  # ms
+        self.processing_time = np.full(capacity, np.nan)  # ms
+        self.total_time = np.full(capacity, np.nan)  # ms
+        self.match_expected = np.zeros(capacity, dtype=bool)
+        self.timeout = np.zeros(capacity, dtype=bool)
+
+    def __len__(self) -> int:
+        return self.size
+
+    def append(self, result: TestResult):
+        """Copy a finished TestResult into the next row"""
+        i = self.size
+        self.email[i] = result.email
+        self.error[i] = result.error
+        self.errored[i] = result.error is not None
+        self.category_code[i] = self.categories.setdefault(result.category, len(self.categories))
+        if result.actual_status is not None:
+            self.status_code[i] = self.statuses.setdefault(result.actual_status, len(self.statuses))
+        if result.api_request_time is not None:
+            self.api_request_time[i] = result.api_request_time
+        if result.processing_time is not None:
+            self.processing_time[i] = result.processing_time
+        if result.total_time is not None:
+            self.total_time[i] = result.total_time
+        self.match_expected[i] = bool(result.match_expected)
+        self.timeout[i] = result.timeout
+        self.size += 1
 
 
 def read_test_emails(csv_file: str) -> List[Tuple[str, str, str]]:
@@ -121,108 +270,137 @@ def read_test_emails(csv_file: str) -> List[Tuple[str, str, str]]:
     return emails
 
 
-def submit_email(email: str) -> Tuple[Optional[str], Optional[str], float]:
+def _retry(fn, *args, retries: int = MAX_RETRIES, base: float = RETRY_DELAY, **kwargs) -> Tuple[requests.Response, float]:
+    """
+    Call a non-idempotent HTTP function, retrying with exponential backoff plus jitter only
+    when the request cannot have been processed: connection failures (including connect
+    timeouts) and RETRYABLE_SUBMIT_STATUS_CODES. A read timeout is raised at once, since
+    the server may already have acted on the request.
+    Returns: (response, request_time_ms of the attempt that produced it)
+    Re-raises the last ConnectionError once retries are exhausted
+    """
+    for attempt in range(retries + 1):
+        start_time = time.perf_counter()
+        try:
+            response = fn(*args, **kwargs)
+            if response.status_code not in RETRYABLE_SUBMIT_STATUS_CODES or attempt == retries:
+                return response, (time.perf_counter() - start_time) * 1000
+        except requests.exceptions.ConnectionError:  # ConnectTimeout is a ConnectionError
+            if attempt == retries:
+                raise
+        
+        time.sleep(base * 2 ** attempt + random.uniform(0, base))
+
+
+def submit_email_batch(emails: List[str]) -> Tuple[List[Optional[str]], Optional[str], float]:
     """
-    Submit email to API for validation
-    Returns: (job_id, error_message, request_time_ms)
+    Submit a batch of emails to API for validation in a single request
+    Returns: (job_id per email, error_message, request_time_ms)
     """
-    start_time = time.time()
+    no_jobs = [None] * len(emails)
+    start_time = time.perf_counter()
     try:
-        response = requests.post(
+        # request_time excludes backoff sleeps; failures below report the full wall time
+        response, request_time = _retry(
+            SESSION.post,
             API_VERIFY_ENDPOINT,
-            json=[email],
+            json=list(emails),
             headers={'Content-Type': 'application/json'},
             timeout=10
         )
-        request_time = (time.time() - start_time) * 1000  # Convert to ms
         
         if response.status_code == 201:
             data = response.json()
-            return data.get('jobId'), None, request_time
+            # The API groups the whole batch under one job
+            return [data.get('jobId')] * len(emails), None, request_time
         else:
             error_msg = f"API returned {response.status_code}: {response.text}"
-            return None, error_msg, request_time
+            return no_jobs, error_msg, request_time
     except requests.exceptions.Timeout:
-        request_time = (time.time() - start_time) * 1000
-        return None, "API request timeout", request_time
+        request_time = (time.perf_counter() - start_time) * 1000
+        return no_jobs, "API request timeout", request_time
     except requests.exceptions.ConnectionError:
-        request_time = (time.time() - start_time) * 1000
-        return None, "Connection error - is the API running?", request_time
+        request_time = (time.perf_counter() - start_time) * 1000
+        return no_jobs, "Connection error - is the API running?", request_time
     except Exception as e:
-        request_time = (time.time() - start_time) * 1000
-        return None, f"Unexpected error: {str(e)}", request_time
+        request_time = (time.perf_counter() - start_time) * 1000
+        return no_jobs, f"Unexpected error: {str(e)}", request_time
 
 
-def poll_job_status(job_id: str, result: TestResult) -> bool:
+async def poll_job_status(client: httpx.AsyncClient, job_id: str, results: List[TestResult]) -> List[TestResult]:
     """
-    Poll job status until completion or timeout
-    Returns: True if completed, False if timeout/error
+    Poll a job once and record the outcome of each of its emails on their results
+    Returns: the results that finished (completed or error); the rest are still pending,
+    as are all of them after a transient failure (MAX_WAIT_TIME bounds how long a job keeps failing)
     """
-    start_poll_time = time.time()
-    last_poll_time = start_poll_time
-    poll_interval = INITIAL_POLL_INTERVAL
-    
-    while True:
-        elapsed = time.time() - start_poll_time
-        
-        # Check timeout
-        if elapsed > MAX_WAIT_TIME:
-            result.timeout = True
-            result.error = f"Timeout after {MAX_WAIT_TIME}s"
-            return False
+    try:
+        # One attempt per sweep: the next sweep is the retry, so no backoff holds up other jobs
+        response = await client.get(f"{API_JOB_ENDPOINT}/{job_id}")
         
-        # Calculate current poll interval (exponential backoff after threshold)
-        if elapsed > EXPONENTIAL_BACKOFF_START:
-            poll_interval = min(poll_interval * 1.2, 2.0)  # Max 2s interval
+        if response.status_code != 200:
+            error = f"Job status API returned {response.status_code}"
+            if 400 <= response.status_code < 500 and response.status_code not in RETRYABLE_STATUS_CODES:
+                # A client error such as 404 "Job not found" will not clear up; fail the job now
+                for result in results:
+                    result.error = error
+                return results
+            for result in results:
+                result.last_poll_error = error
+            return []
         
-        # Wait before polling (except first time)
-        if result.poll_count > 0:
-            time.sleep(poll_interval)
+        data = response.json()
+        # One clock read per response serves every email in it
+        current_time = time.perf_counter()
+        wall_time = None
+        # One response carries every email of the batch; match checks by address
+        checks = {c.get('email'): c for c in data.get('emailChecks', [])}
+        finished = []
         
-        # Poll API
-        try:
-            response = requests.get(
-                f"{API_JOB_ENDPOINT}/{job_id}",
-                timeout=5
-            )
-            
-            if response.status_code != 200:
-                result.error = f"Job status API returned {response.status_code}"
-                return False
-            
-            data = response.json()
+        for result in results:
             result.poll_count += 1
+            result.last_poll_error = None
             
             # Calculate poll interval
-            current_time = time.time()
-            if result.poll_count > 1:
-                interval = (current_time - last_poll_time) * 1000  # ms
-                result.poll_intervals.append(interval)
-            last_poll_time = current_time
+            if result.last_poll_time is not None:
+                interval = (current_time - result.last_poll_time) * 1000  # ms
+                result.poll_interval_sum += interval
+                result.poll_interval_count += 1
+                if result.poll_interval_count <= 3:
+                    result.early_poll_interval_sum += interval
+            result.last_poll_time = current_time
             
-            # Check if job is complete
-            email_checks = data.get('emailChecks', [])
-            if email_checks:
-                check = email_checks[0]  # Single email per job
+            check = checks.get(result.email)
+            if check is None:
+                # Checks are created with the job, so an address missing now never appears
+                # (the hub drops blank entries from the batch)
+                result.error = "Email not found in job results"
+                finished.append(result)
+            else:
                 status = check.get('status')
                 
                 if status != 'PENDING':
-                    # Job completed
+                    # Email completed
                     result.actual_status = status
                     result.smtp_code = check.get('smtpCode')
                     result.bounce_reason = check.get('bounceReason')
-                    result.timestamp_completed = time.time()
-                    return True
-                    
-        except requests.exceptions.Timeout:
-            result.error = "Polling timeout"
-            return False
-        except requests.exceptions.ConnectionError:
-            result.error = "Connection error during polling"
-            return False
-        except Exception as e:
-            result.error = f"Polling error: {str(e)}"
-            return False
+                    if wall_time is None:
+                        wall_time = time.time()
+                    result.perf_completed = current_time
+                    result.timestamp_completed = wall_time
+                    finished.append(result)
+        
+        return finished
+    
+    except httpx.TimeoutException:
+        error = "Polling timeout"
+    except httpx.TransportError:
+        error = "Connection error during polling"
+    except Exception as e:
+        error = f"Polling error: {str(e)}"
+    
+    for result in results:
+        result.last_poll_error = error
+    return []
 
 
 def compare_results(result: TestResult) -> bool:
@@ -230,7 +408,7 @@ def compare_results(result: TestResult) -> bool:
     if result.actual_status is None:
         return False
     
-    expected = result.expected_result.lower()
+    expected = result.expected_lower
     actual = result.actual_status.upper()
     
     # Handle special cases
@@ -245,166 +423,334 @@ def compare_results(result: TestResult) -> bool:
         return result.match_expected
     
     # Standard mapping
-    valid_statuses = EXPECTED_TO_ACTUAL.get(expected, [])
+    valid_statuses = EXPECTED_TO_ACTUAL.get(expected, frozenset())
     result.match_expected = actual in valid_statuses
     return result.match_expected
 
 
-def test_single_email(email: str, expected_result: str, category: str) -> TestResult:
-    """Test a single email and return result"""
-    result = TestResult(email, expected_result, category)
-    result.timestamp_submitted = time.time()
+def submit_test_batch(batch: List[Tuple[str, str, str]]) -> List[TestResult]:
+    """Submit a batch of (email, expected, category) tests and return their pending results"""
+    results = [TestResult(email, expected, category) for email, expected, category in batch]
+    timestamp_submitted = time.time()
+    perf_submitted = time.perf_counter()
     
-    # Submit email
-    job_id, error, api_time = submit_email(email)
-    result.api_request_time = api_time
-    
-    if error:
+    # Submit all emails in one request; each result shares the batch request time
+    job_ids, error, api_time = submit_email_batch([r.email for r in results])
+    for result, job_id in zip(results, job_ids):
+        result.timestamp_submitted = timestamp_submitted
+        result.perf_submitted = perf_submitted
+        result.api_request_time = api_time
+        result.job_id = job_id
         result.error = error
-        return result
-    
-    result.job_id = job_id
     
-    # Poll for completion
-    completed = poll_job_status(job_id, result)
-    
-    if completed:
+    return results
+
+
+def finalize_result(result: TestResult):
+    """Fill in timing metrics and expected-vs-actual match for a finished email"""
+    if result.actual_status is not None:
         # Calculate timing metrics
-        if result.timestamp_completed and result.timestamp_submitted:
-            total_time = (result.timestamp_completed - result.timestamp_submitted) * 1000  # ms
+        if result.perf_completed is not None and result.perf_submitted is not None:
+            total_time = (result.perf_completed - result.perf_submitted) * 1000  # ms
             result.total_time = total_time
             
             # Estimate queue time (time from submission to first non-pending status)
             # For single email jobs, queue time is roughly: total_time - processing_time
             # Processing time is harder to measure precisely, so we estimate:
             # queue_time = time until first poll that shows completion
-            if result.poll_count > 0 and result.poll_intervals:
+            if result.poll_count > 0 and result.poll_interval_count:
                 # Queue time ≈ time until processing started
                 # Estimate: first poll interval or average of early polls
-                result.queue_time = sum(result.poll_intervals[:min(3, len(result.poll_intervals))]) / min(3, len(result.poll_intervals))
+                result.queue_time = result.early_poll_interval_sum / min(3, result.poll_interval_count)
                 result.processing_time = result.total_time - result.api_request_time - (result.queue_time if result.queue_time else 0)
             else:
                 result.processing_time = result.total_time - result.api_request_time
         
         # Compare results
         compare_results(result)
-    
-    return result
+
+
+class Poller(threading.Thread):
+    """
+    Single background thread that polls every in-flight job on a shared interval.
+    Results are grouped by job_id so a batch costs one GET per sweep, and each
+    sweep issues all GETs concurrently from one asyncio event loop over a
+    keep-alive httpx client, so no worker thread is held per request.
+    """
+    def __init__(self):
+        super().__init__(name="job-poller", daemon=True)
+        self.pending: Dict[str, List[TestResult]] = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+        self.wakeup = threading.Event()  # set by register/stop to start a sweep early
+        self.finished = queue.Queue()  # finished TestResults, in completion order
+        self.exception: Optional[BaseException] = None  # set if the polling loop died
+
+    def register(self, job_id: str, result: TestResult):
+        """Start polling job_id on behalf of result; result is put on finished once it finishes"""
+        result.job_id = job_id
+        result.poll_started = time.perf_counter()
+        with self.lock:
+            self.pending.setdefault(job_id, []).append(result)
+        # Poll the new job straight away rather than after the rest of POLL_INTERVAL
+        self.wakeup.set()
+
+    def run(self):
+        try:
+            asyncio.run(self._run())
+        except BaseException as e:
+            self.exception = e
+            raise
+
+    async def _run(self):
+        limits = httpx.Limits(max_connections=POLL_MAX_CONNECTIONS, max_keepalive_connections=POLL_MAX_CONNECTIONS)
+        # Requests queue for a free connection without a pool timeout; MAX_WAIT_TIME bounds each email
+        timeout = httpx.Timeout(5, pool=None)
+        async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+            while not self.stopped.is_set():
+                await asyncio.to_thread(self.wakeup.wait, POLL_INTERVAL)
+                self.wakeup.clear()
+                with self.lock:
+                    snapshot = [(job_id, list(results)) for job_id, results in self.pending.items()]
+                if not snapshot:
+                    continue
+                
+                now = time.perf_counter()
+                finished_per_job = await asyncio.gather(*(self._poll(client, job_id, results, now) for job_id, results in snapshot))
+                finished = {id(r): r for job_finished in finished_per_job for r in job_finished}
+                with self.lock:
+                    for job_id, _ in snapshot:
+                        # Keep the job until every one of its emails has finished
+                        remaining = [r for r in self.pending[job_id] if id(r) not in finished]
+                        if remaining:
+                            self.pending[job_id] = remaining
+                        else:
+                            del self.pending[job_id]
+                for result in finished.values():
+                    self.finished.put(result)
+
+    async def _poll(self, client: httpx.AsyncClient, job_id: str, results: List[TestResult], now: float) -> List[TestResult]:
+        """
+        Poll one job for its pending results; returns those that completed, errored or timed out
+        now is the sweep's perf_counter reading, shared by every job's timeout check
+        """
+        timed_out = [r for r in results if now - r.poll_started > MAX_WAIT_TIME]
+        for result in timed_out:
+            result.timeout = True
+            result.error = f"Timeout after {MAX_WAIT_TIME}s"
+            if result.last_poll_error:
+                result.error += f" (last poll error: {result.last_poll_error})"
+        
+        waiting = [r for r in results if not r.timeout]
+        if not waiting:
+            return timed_out
+        
+        finished = await poll_job_status(client, job_id, waiting)
+        for result in finished:
+            finalize_result(result)
+        return timed_out + finished
+
+    def fail_pending(self):
+        """Fail every result still registered, for use once the poller thread has died"""
+        error = f"Poller stopped: {self.exception!r}"
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        for results in pending.values():
+            for result in results:
+                result.error = error
+                self.finished.put(result)
+
+    def stop(self):
+        self.stopped.set()
+        self.wakeup.set()
+        self.join()
+
+
+def run_tests(tests: List[Tuple[str, str, str]], poller: Poller) -> Iterator[TestResult]:
+    """
+    Submit (email, expected, category) tests in batches and yield each result as it finishes
+    Results are yielded in completion order; failed submissions finish immediately.
+    A batch is only submitted once it fits under MAX_IN_FLIGHT unfinished emails.
+    """
+    batches = [tests[i:i + BATCH_SIZE] for i in range(0, len(tests), BATCH_SIZE)]
+    next_batch = 0
+    in_flight = 0
+    remaining = len(tests)
+    
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as ex:
+        while remaining:
+            fitting = []
+            while next_batch < len(batches) and (in_flight == 0 or in_flight + len(batches[next_batch]) <= MAX_IN_FLIGHT):
+                fitting.append(batches[next_batch])
+                in_flight += len(batches[next_batch])
+                next_batch += 1
+            for batch in ex.map(submit_test_batch, fitting):
+                for result in batch:
+                    if result.error:
+                        poller.finished.put(result)
+                    else:
+                        poller.register(result.job_id, result)
+            
+            try:
+                result = poller.finished.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                # A dead poller never finishes its results; fail them rather than wait forever
+                if not poller.is_alive():
+                    poller.fail_pending()
+                continue
+            in_flight -= 1
+            remaining -= 1
+            yield result
 
 
 def calculate_percentiles(values: List[float], percentiles: List[int]) -> Dict[int, float]:
-    """Calculate percentiles from a list of values"""
-    if not values:
+    """Calculate percentiles from a list of values using partial selection instead of a full sort"""
+    if len(values) == 0:
         return {p: 0.0 for p in percentiles}
     
-    sorted_values = sorted(values)
-    result = {}
-    for p in percentiles:
-        index = int(len(sorted_values) * p / 100)
-        index = min(index, len(sorted_values) - 1)
-        result[p] = sorted_values[index]
-    return result
+    arr = np.asarray(values, dtype=np.float64)
+    indices = [min(int(len(arr) * p / 100), len(arr) - 1) for p in percentiles]
+    partitioned = np.partition(arr, indices)
+    return {p: float(partitioned[i]) for p, i in zip(percentiles, indices)}
 
 
-def generate_summary(results: List[TestResult]) -> Dict:
-    """Generate summary statistics"""
+def generate_summary(results: Results, elapsed: float) -> Dict:
+    """
+    Generate summary statistics column-wise over the recorded results
+    elapsed is the wall-clock duration of the test run in seconds, used for throughput
+    """
     total = len(results)
-    completed = [r for r in results if r.actual_status is not None]
-    matched = [r for r in completed if r.match_expected]
-    errors = [r for r in results if r.error]
-    timeouts = [r for r in results if r.timeout]
-    
-    # Timing statistics
-    total_times = [r.total_time for r in completed if r.total_time]
-    api_times = [r.api_request_time for r in results if r.api_request_time]
-    processing_times = [r.processing_time for r in completed if r.processing_time and r.processing_time > 0]
+    status_code = results.status_code[:total]
+    completed_mask = status_code >= 0
+    error_mask = results.errored[:total]
+    matched_mask = results.match_expected[:total]
+    completed = int(completed_mask.sum())
+    matched = int((matched_mask & completed_mask).sum())
+    
+    # Timing statistics, reduced as contiguous float64 arrays (NaN and 0 mean not measured)
+    total_times = results.total_time[:total][completed_mask]
+    total_times = total_times[total_times > 0]
+    api_times = results.api_request_time[:total]
+    api_times = api_times[api_times > 0]
+    processing_times = results.processing_time[:total][completed_mask]
+    processing_times = processing_times[processing_times > 0]
     
     # Category breakdown
-    category_stats = defaultdict(lambda: {'total': 0, 'completed': 0, 'matched': 0, 'errors': 0})
-    for r in results:
-        cat = r.category
-        category_stats[cat]['total'] += 1
-        if r.actual_status:
-            category_stats[cat]['completed'] += 1
-        if r.match_expected:
-            category_stats[cat]['matched'] += 1
-        if r.error:
-            category_stats[cat]['errors'] += 1
+    category_code = results.category_code[:total]
+    n_categories = len(results.categories)
+    columns = {
+        'total': np.bincount(category_code, minlength=n_categories),
+        'completed': np.bincount(category_code, weights=completed_mask, minlength=n_categories),
+        'matched': np.bincount(category_code, weights=matched_mask, minlength=n_categories),
+        'errors': np.bincount(category_code, weights=error_mask, minlength=n_categories),
+    }
+    category_stats = {
+        cat: {name: int(counts[j]) for name, counts in columns.items()}
+        for cat, j in results.categories.items()
+    }
     
     # Status breakdown
-    status_counts = defaultdict(int)
-    for r in completed:
-        status_counts[r.actual_status] += 1
+    status_totals = np.bincount(status_code[completed_mask], minlength=len(results.statuses))
+    status_counts = {status: int(status_totals[j]) for status, j in results.statuses.items()}
     
     summary = {
         'total_emails': total,
-        'completed': len(completed),
-        'errors': len(errors),
-        'timeouts': len(timeouts),
-        'success_rate': (len(matched) / len(completed) * 100) if completed else 0,
-        'completion_rate': (len(completed) / total * 100) if total > 0 else 0,
+        'completed': completed,
+        'errors': int(error_mask.sum()),
+        'timeouts': int(results.timeout[:total].sum()),
+        'success_rate': (matched / completed * 100) if completed else 0,
+        'completion_rate': (completed / total * 100) if total > 0 else 0,
         'timing': {
             'total_time': {
-                'min': min(total_times) if total_times else 0,
-                'max': max(total_times) if total_times else 0,
-                'avg': sum(total_times) / len(total_times) if total_times else 0,
+                'min': float(total_times.min()) if total_times.size else 0,
+                'max': float(total_times.max()) if total_times.size else 0,
+                'avg': float(total_times.mean()) if total_times.size else 0,
                 'percentiles': calculate_percentiles(total_times, [50, 90, 95, 99])
             },
             'api_time': {
-                'min': min(api_times) if api_times else 0,
-                'max': max(api_times) if api_times else 0,
-                'avg': sum(api_times) / len(api_times) if api_times else 0
+                'min': float(api_times.min()) if api_times.size else 0,
+                'max': float(api_times.max()) if api_times.size else 0,
+                'avg': float(api_times.mean()) if api_times.size else 0
             },
             'processing_time': {
-                'min': min(processing_times) if processing_times else 0,
-                'max': max(processing_times) if processing_times else 0,
-                'avg': sum(processing_times) / len(processing_times) if processing_times else 0
+                'min': float(processing_times.min()) if processing_times.size else 0,
+                'max': float(processing_times.max()) if processing_times.size else 0,
+                'avg': float(processing_times.mean()) if processing_times.size else 0
             }
         },
-        'category_breakdown': dict(category_stats),
-        'status_breakdown': dict(status_counts),
-        'throughput': len(completed) / (sum(total_times) / 1000) if total_times else 0  # emails per second
+        'category_breakdown': category_stats,
+        'status_breakdown': status_counts,
+        'throughput': completed / elapsed if elapsed > 0 else 0  # emails per second
     }
     
     return summary
 
 
-def write_csv_output(results: List[TestResult], filename: str):
-    """Write results to CSV file"""
-    if not results:
-        return
-    
-    fieldnames = [
-        'email', 'category', 'expected_result', 'actual_status', 'smtp_code',
-        'bounce_reason', 'match_expected', 'api_request_time', 'queue_time',
-        'processing_time', 'total_time', 'poll_count', 'poll_interval_avg',
-        'timestamp_submitted', 'timestamp_completed', 'job_id', 'error', 'timeout'
-    ]
-    
-    with open(filename, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=fieldnames)
-        writer.writeheader()
-        for result in results:
-            writer.writerow(result.to_csv_row())
+class ErrorLog:
+    """Append-only error log, opened on the first error so clean runs leave no file behind"""
+    def __init__(self, filename: str):
+        self.filename = filename
+        self.file = None
+
+    def write(self, email: str, error: str):
+        if self.file is None:
+            self.file = open(self.filename, 'a', encoding='utf-8', buffering=1)  # line-buffered
+        self.file.write(f"{datetime.now().isoformat()} - {email}: {error}\n")
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+
 
+class CsvOutput:
+    """Streams result rows to a CSV file as each email finishes"""
+    def __init__(self, filename: str):
+        self.file = open(filename, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(CSV_FIELDNAMES)
 
-def write_json_output(results: List[TestResult], summary: Dict, filename: str):
-    """Write results to JSON file"""
-    output = {
-        'test_metadata': {
+    def write(self, result: TestResult):
+        self.writer.writerow(result.to_csv_tuple())
+
+    def close(self):
+        self.file.close()
+
+
+class JsonOutput:
+    """Streams results to a JSON file as each email finishes; the summary is appended on close"""
+    def __init__(self, filename: str, total_emails: int):
+        self.file = open(filename, 'wb')
+        self.count = 0
+        metadata = {
             'timestamp': datetime.now().isoformat(),
-            'total_emails': len(results),
+            'total_emails': total_emails,
             'api_endpoint': API_VERIFY_ENDPOINT
-        },
-        'summary': summary,
-        'results': [r.to_dict() for r in results]
-    }
-    
-    with open(filename, 'w', encoding='utf-8') as f:
-        json.dump(output, f, indent=2, ensure_ascii=False)
+        }
+        self.file.write(b'{\n  "test_metadata": ' + self._dumps(metadata, b'  ') + b',\n  "results": [')
+
+    @staticmethod
+    def _dumps(obj, indent: bytes) -> bytes:
+        """Pretty-print obj as UTF-8 JSON, as it would appear nested at the given indent"""
+        if HAS_ORJSON:
+            # Only plain Python values are written; percentile keys are ints
+            encoded = orjson.dumps(obj, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+        else:
+            encoded = json.dumps(obj, indent=2, ensure_ascii=False).encode('utf-8')
+        return encoded.replace(b'\n', b'\n' + indent)
+
+    def write(self, result: TestResult):
+        self.file.write((b',\n    ' if self.count else b'\n    ') + self._dumps(result.to_dict(), b'    '))
+        self.count += 1
 
+    def close(self, summary: Optional[Dict] = None):
+        """Finish the document; summary is None when the run stops before it is generated"""
+        if self.file.closed:
+            return
+        self.file.write((b'\n  ' if self.count else b'') + b'],\n  "summary": ' + self._dumps(summary, b'  ') + b'\n}\n')
+        self.file.close()
 
-def write_summary_report(results: List[TestResult], summary: Dict, filename: str):
+
+def write_summary_report(results: Results, summary: Dict, filename: str):
     """Write human-readable summary report"""
     with open(filename, 'w', encoding='utf-8') as f:
         f.write("=" * 80 + "\n")
@@ -460,10 +806,10 @@ def write_summary_report(results: List[TestResult], summary: Dict, filename: str
         
         f.write("ERRORS\n")
         f.write("-" * 80 + "\n")
-        error_results = [r for r in results if r.error]
-        if error_results:
-            for r in error_results:
-                f.write(f"  {r.email}: {r.error}\n")
+        error_rows = np.flatnonzero(results.errored[:len(results)])
+        if error_rows.size:
+            for i in error_rows:
+                f.write(f"  {results.email[i]}: {results.error[i]}\n")
         else:
             f.write("  No errors\n")
 
@@ -481,121 +827,159 @@ def main():
     print(f"Found {len(all_test_emails)} total emails in file\n")
     
     timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+    # Columnar copy of every finished result, used for the summaries
+    results_table = Results(len(all_test_emails))
     error_log_file = f"../logs/test-errors-{timestamp}.log"
     
-    # Step 1: Test 5 emails first
-    print("=" * 80)
-    print("PHASE 1: Testing 5 emails first...")
-    print("=" * 80)
-    
-    test_emails_5 = all_test_emails[:5]
-    results_5 = []
+    # One background poller drives every in-flight job for both phases
+    poller = Poller()
+    poller.start()
+    error_log = ErrorLog(error_log_file)
+    csv_output = json_output = None  # opened in phase 2
     
-    # Progress tracking for 5 emails
-    if HAS_TQDM:
-        iterator = tqdm(test_emails_5, desc="Testing 5 emails", unit="email")
-    else:
-        iterator = test_emails_5
-        print("Testing 5 emails...")
-    
-    for i, (email, expected, category) in enumerate(iterator, 1):
-        if not HAS_TQDM:
-            print(f"[{i}/5] Testing: {email}")
+    try:
+        # Step 1: Test 5 emails first
+        print("=" * 80)
+        print("PHASE 1: Testing 5 emails first...")
+        print("=" * 80)
         
-        result = test_single_email(email, expected, category)
-        results_5.append(result)
+        test_emails_5 = all_test_emails[:5]
+        phase_1_start = time.perf_counter()
+        results_5 = []  # kept until the output files are opened in phase 2
         
-        # Log errors
-        if result.error:
-            with open(error_log_file, 'a', encoding='utf-8') as f:
-                f.write(f"{datetime.now().isoformat()} - {email}: {result.error}\n")
-    
-    # Check if 5-email test was successful
-    summary_5 = generate_summary(results_5)
-    success_threshold = 80.0  # At least 80% completion rate
-    
-    print("\n" + "=" * 80)
-    print("PHASE 1 RESULTS")
-    print("=" * 80)
-    print(f"Completed: {summary_5['completed']}/{summary_5['total_emails']} ({summary_5['completion_rate']:.1f}%)")
-    print(f"Errors: {summary_5['errors']}")
-    print(f"Timeouts: {summary_5['timeouts']}")
-    
-    if summary_5['completion_rate'] < success_threshold:
-        print(f"\n❌ Phase 1 failed: Completion rate ({summary_5['completion_rate']:.1f}%) below threshold ({success_threshold}%)")
-        print("Stopping tests. Please check your setup before running full test.")
-        
-        # Still save the 5-email results
-        summary_file_5 = f"results/test-summary-5emails-{timestamp}.txt"
-        write_summary_report(results_5, summary_5, summary_file_5)
-        print(f"✓ Partial results saved to: {summary_file_5}")
-        return
-    
-    print(f"\n✅ Phase 1 successful! Proceeding to test all {len(all_test_emails)} emails...\n")
-    
-    # Step 2: Test all emails
-    print("=" * 80)
-    print(f"PHASE 2: Testing all {len(all_test_emails)} emails...")
-    print("=" * 80)
-    
-    # Start with the 5 we already tested
-    all_results = results_5.copy()
-    
-    # Test remaining emails
-    remaining_emails = all_test_emails[5:]
-    
-    if HAS_TQDM:
-        iterator = tqdm(remaining_emails, desc="Testing remaining emails", unit="email", initial=5, total=len(all_test_emails))
-    else:
-        iterator = remaining_emails
-        print(f"Testing remaining {len(remaining_emails)} emails...")
-    
-    for i, (email, expected, category) in enumerate(iterator, 1):
-        if not HAS_TQDM:
-            print(f"[{5+i}/{len(all_test_emails)}] Testing: {email}")
+        # Progress tracking for 5 emails
+        if HAS_TQDM:
+            pbar = tqdm(total=len(test_emails_5), desc="Testing 5 emails", unit="email")
+        else:
+            pbar = None
+            print("Testing 5 emails...")
         
-        result = test_single_email(email, expected, category)
-        all_results.append(result)
+        for i, result in enumerate(run_tests(test_emails_5, poller), 1):
+            results_5.append(result)
+            results_table.append(result)
+            if pbar:
+                pbar.update(1)
+            else:
+                print(f"[{i}/5] Tested: {result.email}")
+            
+            # Log errors
+            if result.error:
+                error_log.write(result.email, result.error)
         
-        # Log errors
-        if result.error:
-            with open(error_log_file, 'a', encoding='utf-8') as f:
-                f.write(f"{datetime.now().isoformat()} - {email}: {result.error}\n")
-    
-    print("\n" + "=" * 80)
-    print("Test completed! Generating reports...\n")
-    
-    # Generate summary for all results
-    summary = generate_summary(all_results)
-    
-    # Write output files
-    csv_file = f"results/test-results-{timestamp}.csv"
-    json_file = f"results/test-results-{timestamp}.json"
-    summary_file = f"results/test-summary-{timestamp}.txt"
-    
-    write_csv_output(all_results, csv_file)
-    print(f"✓ CSV output: {csv_file}")
-    
-    write_json_output(all_results, summary, json_file)
-    print(f"✓ JSON output: {json_file}")
-    
-    write_summary_report(all_results, summary, summary_file)
-    print(f"✓ Summary report: {summary_file}")
-    
-    if any(r.error for r in all_results):
-        print(f"✓ Error log: {error_log_file}")
-    
-    # Print summary to console
-    print("\n" + "=" * 80)
-    print("FINAL SUMMARY")
-    print("=" * 80)
-    print(f"Total Emails: {summary['total_emails']}")
-    print(f"Completed: {summary['completed']} ({summary['completion_rate']:.1f}%)")
-    print(f"Success Rate: {summary['success_rate']:.1f}%")
-    print(f"Throughput: {summary['throughput']:.2f} emails/second")
-    print(f"Avg Total Time: {summary['timing']['total_time']['avg']:.2f} ms")
-    print(f"Avg Processing Time: {summary['timing']['processing_time']['avg']:.2f} ms")
-    print("=" * 80)
+        if pbar:
+            pbar.close()
+        
+        phase_1_elapsed = time.perf_counter() - phase_1_start
+        
+        # Check if 5-email test was successful
+        summary_5 = generate_summary(results_table, phase_1_elapsed)
+        success_threshold = 80.0  # At least 80% completion rate
+        
+        print("\n" + "=" * 80)
+        print("PHASE 1 RESULTS")
+        print("=" * 80)
+        print(f"Completed: {summary_5['completed']}/{summary_5['total_emails']} ({summary_5['completion_rate']:.1f}%)")
+        print(f"Errors: {summary_5['errors']}")
+        print(f"Timeouts: {summary_5['timeouts']}")
+        
+        if summary_5['completion_rate'] < success_threshold:
+            print(f"\n❌ Phase 1 failed: Completion rate ({summary_5['completion_rate']:.1f}%) below threshold ({success_threshold}%)")
+            print("Stopping tests. Please check your setup before running full test.")
+            
+            # Still save the 5-email results
+            summary_file_5 = f"results/test-summary-5emails-{timestamp}.txt"
+            write_summary_report(results_table, summary_5, summary_file_5)
+            print(f"✓ Partial results saved to: {summary_file_5}")
+            return
+        
+        print(f"\n✅ Phase 1 successful! Proceeding to test all {len(all_test_emails)} emails...\n")
+        
+        # Step 2: Test all emails
+        print("=" * 80)
+        print(f"PHASE 2: Testing all {len(all_test_emails)} emails...")
+        print("=" * 80)
+        
+        # Output files are streamed as results finish, starting with the 5 we already tested
+        csv_file = f"results/test-results-{timestamp}.csv"
+        json_file = f"results/test-results-{timestamp}.json"
+        summary_file = f"results/test-summary-{timestamp}.txt"
+        csv_output = CsvOutput(csv_file)
+        json_output = JsonOutput(json_file, len(all_test_emails))
+        for result in results_5:
+            csv_output.write(result)
+            json_output.write(result)
+        del results_5  # results_table holds everything the summaries need
+        
+        # Test remaining emails
+        remaining_emails = all_test_emails[5:]
+        phase_2_start = time.perf_counter()
+        
+        if HAS_TQDM:
+            pbar = tqdm(desc="Testing remaining emails", unit="email", initial=5, total=len(all_test_emails))
+        else:
+            pbar = None
+            print(f"Testing remaining {len(remaining_emails)} emails...")
+        
+        for i, result in enumerate(run_tests(remaining_emails, poller), 1):
+            csv_output.write(result)
+            json_output.write(result)
+            results_table.append(result)
+            if pbar:
+                pbar.update(1)
+            else:
+                print(f"[{5+i}/{len(all_test_emails)}] Tested: {result.email}")
+            
+            # Log errors
+            if result.error:
+                error_log.write(result.email, result.error)
+        
+        if pbar:
+            pbar.close()
+        phase_2_elapsed = time.perf_counter() - phase_2_start
+        
+        print("\n" + "=" * 80)
+        print("Test completed! Generating reports...\n")
+        
+        # Generate summary for all results; throughput covers the time spent testing in both phases
+        summary = generate_summary(results_table, phase_1_elapsed + phase_2_elapsed)
+        
+        # Finish output files; they are independent, so flush and write them concurrently
+        with ThreadPoolExecutor(max_workers=3) as ex:
+            csv_done = ex.submit(csv_output.close)
+            json_done = ex.submit(json_output.close, summary)
+            report_done = ex.submit(write_summary_report, results_table, summary, summary_file)
+        
+        csv_done.result()
+        print(f"✓ CSV output: {csv_file}")
+        
+        json_done.result()
+        print(f"✓ JSON output: {json_file}")
+        
+        report_done.result()
+        print(f"✓ Summary report: {summary_file}")
+        
+        if summary['errors']:
+            print(f"✓ Error log: {error_log_file}")
+        
+        # Print summary to console
+        print("\n" + "=" * 80)
+        print("FINAL SUMMARY")
+        print("=" * 80)
+        print(f"Total Emails: {summary['total_emails']}")
+        print(f"Completed: {summary['completed']} ({summary['completion_rate']:.1f}%)")
+        print(f"Success Rate: {summary['success_rate']:.1f}%")
+        print(f"Throughput: {summary['throughput']:.2f} emails/second")
+        print(f"Avg Total Time: {summary['timing']['total_time']['avg']:.2f} ms")
+        print(f"Avg Processing Time: {summary['timing']['processing_time']['avg']:.2f} ms")
+        print("=" * 80)
+    finally:
+        poller.stop()
+        error_log.close()
+        # No-ops after a normal finish; otherwise keeps whatever was streamed before the failure
+        if csv_output is not None:
+            csv_output.close()
+        if json_output is not None:
+            json_output.close()
 
 
 if __name__ == '__main__':